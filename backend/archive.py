@@ -0,0 +1,201 @@
+"""Convert folders of output_data_A.csv / output_data_B.csv logs into
+compressed columnar archives, one .npz per CSV with one array per column.
+
+    python archive.py ~/Agnirath/HiddenValleyLogs ~/Agnirath/archive -j 8
+
+An archive_index.json next to the archives holds per-file summaries (row
+count, Timestamp range, min/max of every field) so queries can skip whole
+files without opening them. Re-running only converts CSVs that changed."""
+
+import argparse
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from downlink import load_structure
+
+
+LOG_NAMES = ("output_data_A.csv", "output_data_B.csv")
+INDEX_NAME = "archive_index.json"
+FALLBACK_DTYPE = "float64"  # derived columns that aren't in packet_structure.json
+
+
+def column_dtypes(structure: dict) -> dict:
+    """Storage dtype for every known field. Logged values are already
+    scaled, so fields with a multiplier no longer fit their wire type."""
+    dtypes = {}
+    for key, field in structure["Fields"].items():
+        wire = field["type"]
+        if wire.startswith("custom"):
+            continue
+        if wire == "bool":
+            dtypes[key] = "bool"
+        elif "multiplier" in field:
+            dtypes[key] = "float32"
+        else:
+            dtypes[key] = wire
+    return dtypes
+
+
+def _nullable(dtype: str) -> str:
+    """read_csv dtype that tolerates empty cells (torn rows, late fields)"""
+    if dtype == "bool":
+        return "boolean"
+    if dtype.startswith(("int", "uint")):
+        return dtype.capitalize().replace("Uint", "UInt")
+    return dtype
+
+
+BOOL_STRINGS = {"True": True, "False": False, True: True, False: False}
+
+
+def _cast(column: pd.Series, dtype: str) -> np.ndarray:
+    if column.dtype == object:
+        if dtype == "bool":
+            column = column.map(BOOL_STRINGS)
+        column = pd.to_numeric(column, errors="coerce")
+
+    if column.isna().any() and dtype not in ("float16", "float32", "float64"):
+        return column.astype("float32").to_numpy(na_value=np.nan)  # ints/bools with gaps
+    return column.to_numpy(dtype=dtype)
+
+
+def _read_log(src: str, dtypes: dict) -> pd.DataFrame:
+    header = pd.read_csv(src, nrows=0).columns
+    typed = {name: _nullable(dtypes[name]) for name in header if name in dtypes}
+    try:
+        return pd.read_csv(src, dtype=typed, low_memory=False)
+    except (ValueError, TypeError):
+        # Some cell doesn't parse as its field type, coerce column by column
+        return pd.read_csv(src, low_memory=False)
+
+
+def _finite(value) -> float | None:
+    value = float(value)
+    return value if math.isfinite(value) else None
+
+
+def convert_file(src: str, dst: str, dtypes: dict) -> dict:
+    """Convert one CSV, returns its summary. Runs in the worker pool."""
+    df = _read_log(src, dtypes)
+
+    columns = {name: _cast(df[name], dtypes.get(name, FALLBACK_DTYPE)) for name in df.columns}
+
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    tmp = dst + ".tmp.npz"
+    np.savez_compressed(tmp, **columns)
+    os.replace(tmp, dst)
+
+    fields = {}
+    for name, values in columns.items():
+        if len(values) == 0:
+            continue
+        values = values.astype("float64")
+        if np.isnan(values).all():
+            continue
+        fields[name] = [_finite(np.nanmin(values)), _finite(np.nanmax(values))]
+
+    return {
+        "source": src,
+        "source_mtime": os.path.getmtime(src),
+        "rows": len(df),
+        "time_range": fields.get("Timestamp"),
+        "fields": fields,
+    }
+
+
+def find_logs(root: str):
+    for dirpath, _, files in os.walk(root):
+        for name in LOG_NAMES:
+            if name in files:
+                yield os.path.join(dirpath, name)
+
+
+def load_index(out_root: str) -> dict:
+    path = os.path.join(out_root, INDEX_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def convert_tree(src_root: str, out_root: str, jobs: int | None = None, force: bool = False) -> dict:
+    """Convert every log under src_root, one file per worker"""
+    dtypes = column_dtypes(load_structure())
+    index = load_index(out_root)
+
+    tasks = {}
+    for src in find_logs(src_root):
+        rel = os.path.splitext(os.path.relpath(src, src_root))[0] + ".npz"
+        dst = os.path.join(out_root, rel)
+        known = index.get(rel)
+        if (not force and known and os.path.exists(dst)
+                and known["source_mtime"] == os.path.getmtime(src)):
+            continue
+        tasks[rel] = (src, dst)
+
+    print(f"{len(tasks)} file(s) to convert, {len(index)} already archived")
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(convert_file, src, dst, dtypes): rel
+                   for rel, (src, dst) in tasks.items()}
+        for future in as_completed(futures):
+            rel = futures[future]
+            try:
+                index[rel] = future.result()
+                print(f"converted {rel} ({index[rel]['rows']} rows)")
+            except Exception as e:
+                print(f"failed {rel}: {e}")
+
+    os.makedirs(out_root, exist_ok=True)
+    tmp = os.path.join(out_root, INDEX_NAME + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(index, f, indent=1)
+    os.replace(tmp, os.path.join(out_root, INDEX_NAME))
+    return index
+
+
+def select(out_root: str, ranges: dict | None = None, log_type: str | None = None) -> list:
+    """Archives that may hold rows inside all of `ranges`
+    ({field: (lo, hi)}, either bound may be None), judged from the index"""
+    selected = []
+    for rel, summary in load_index(out_root).items():
+        if log_type and not rel.endswith(f"output_data_{log_type}.npz"):
+            continue
+        ok = True
+        for field, (lo, hi) in (ranges or {}).items():
+            span = summary["fields"].get(field)
+            if span is None or None in span:
+                continue  # can't rule it out
+            if (lo is not None and span[1] < lo) or (hi is not None and span[0] > hi):
+                ok = False
+                break
+        if ok:
+            selected.append(os.path.join(out_root, rel))
+    return selected
+
+
+def load(path: str, columns=None) -> pd.DataFrame:
+    """Read an archive back, only decompressing the requested columns"""
+    with np.load(path) as archive:
+        names = columns or archive.files
+        return pd.DataFrame({name: archive[name] for name in names})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("src", help="directory tree containing log folders")
+    parser.add_argument("out", help="archive output directory")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--force", action="store_true", help="reconvert files already archived")
+    args = parser.parse_args()
+
+    convert_tree(args.src, args.out, args.jobs, args.force)
+
+
+if __name__ == "__main__":
+    main()
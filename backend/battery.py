@@ -0,0 +1,117 @@
+import numpy as np
+
+
+N_CMUS = 5
+N_CELLS = 8
+HISTORY = 600            # frames kept for dV/dt and /api/battery/history
+DVDT_WINDOW = 30         # frames in the rolling dV/dt fit
+CELL_VALID = (0.5, 10)   # readings outside this are unpopulated/faulty channels
+Z_WARN = 3.0             # deviation z-score flagged as an outlier
+STD_FLOOR = 0.005        # V, cells report in 2 mV steps so a balanced pack has ~0 std
+SPREAD_WARN = 0.05       # V between strongest and weakest cell
+DVDT_WARN = 0.5e-3       # V/s a cell may sag faster than the pack mean
+
+
+class BatteryAnalytics:
+    """Per-frame pack statistics over the 5x8 cell block in one vectorized
+    pass: voltage/temperature min/max/mean/spread, per-cell deviation
+    z-scores, weakest cell, and a rolling least-squares dV/dt per cell
+    from a ring buffer of recent frames."""
+
+    def __init__(self, history: int = HISTORY):
+        self.volts = np.full((history, N_CMUS, N_CELLS), np.nan)
+        self.times = np.zeros(history)
+        self.count = 0
+
+        self.volt_stats = np.zeros(4)   # min, max, mean, spread
+        self.temp_stats = np.zeros(4)
+        self.z = np.zeros((N_CMUS, N_CELLS))
+        self.dvdt = np.zeros((N_CMUS, N_CELLS))
+        self.fitted = np.zeros((N_CMUS, N_CELLS), dtype=bool)  # cells with a full dV/dt window
+        self.weakest = (0, 0)
+        self.outliers = np.zeros((N_CMUS, N_CELLS), dtype=bool)
+        self.spread_warning = False
+
+    def update(self, cell_volts: np.ndarray, temps: np.ndarray, t: float):
+        """Process one frame. `t` is in seconds and only needs to be monotonic,
+        repeated values (several frames within one second) are fine"""
+        lo, hi = CELL_VALID
+        valid = (cell_volts > lo) & (cell_volts < hi)
+        if not valid.any():
+            return
+        v = cell_volts[valid]
+        self.volt_stats[:] = _stats(v)
+        self.temp_stats[:] = _stats(temps.ravel())
+
+        self.z.fill(0)
+        self.z[valid] = (v - self.volt_stats[2]) / max(v.std(), STD_FLOOR)
+        self.weakest = np.unravel_index(np.where(valid, cell_volts, np.inf).argmin(), valid.shape)
+
+        # Ring buffer, restart when the clock goes back (new session, midnight)
+        if self.count and t < self.times[(self.count - 1) % len(self.times)]:
+            self.count = 0
+            self.volts.fill(np.nan)
+        slot = self.count % len(self.times)
+        self.volts[slot] = np.where(valid, cell_volts, np.nan)
+        self.times[slot] = t
+        self.count += 1
+
+        self._fit_dvdt()
+
+        self.outliers = np.abs(self.z) > Z_WARN
+        trend = valid & self.fitted
+        if trend.any():
+            self.outliers |= trend & (self.dvdt < self.dvdt[trend].mean() - DVDT_WARN)
+        self.spread_warning = self.volt_stats[3] > SPREAD_WARN
+
+    def _fit_dvdt(self):
+        n = min(self.count, DVDT_WINDOW)
+        idx = (self.count - n + np.arange(n)) % len(self.times)
+        t = self.times[idx] - self.times[idx].mean()
+        if n < 2 or not t.any():
+            self.dvdt.fill(0)
+            self.fitted.fill(False)
+            return
+        # t is centred so the slope is just t.v / t.t, cells with a gap in
+        # the window come out NaN and read as flat
+        slope = t @ self.volts[idx].reshape(n, N_CMUS * N_CELLS) / (t @ t)
+        self.fitted.ravel()[:] = ~np.isnan(slope)
+        slope[np.isnan(slope)] = 0
+        self.dvdt.ravel()[:] = slope
+
+    def ranges(self) -> tuple:
+        """(min_temp, max_temp, min_volt, max_volt) for battery_ranges"""
+        return (self.temp_stats[0], self.temp_stats[1], self.volt_stats[0], self.volt_stats[1])
+
+    def summary(self) -> dict:
+        """Compact dashboard fields"""
+        return {
+            'volt': dict(zip(('min', 'max', 'mean', 'spread'), np.round(self.volt_stats, 4).tolist())),
+            'temp': dict(zip(('min', 'max', 'mean', 'spread'), np.round(self.temp_stats, 2).tolist())),
+            'z': np.round(self.z, 2).tolist(),
+            'dvdt': np.round(self.dvdt * 1000, 3).tolist(),  # mV/s
+            'weakest': [int(i) for i in self.weakest],
+            'outliers': np.argwhere(self.outliers).tolist(),
+            'warning': bool(self.spread_warning or self.outliers.any()),
+        }
+
+    def history(self, cells: bool = False) -> dict:
+        """Frames in the ring buffer, oldest first"""
+        n = min(self.count, len(self.times))
+        idx = (self.count - n + np.arange(n)) % len(self.times)
+        v = self.volts[idx].reshape(n, N_CMUS * N_CELLS)
+        out = {
+            'times': self.times[idx].tolist(),
+            'min': np.nanmin(v, axis=1).tolist() if n else [],
+            'max': np.nanmax(v, axis=1).tolist() if n else [],
+            'mean': np.nanmean(v, axis=1).tolist() if n else [],
+        }
+        out['spread'] = [a - b for a, b in zip(out['max'], out['min'])]
+        if cells:
+            out['cells'] = np.where(np.isnan(v), None, v).reshape(n, N_CMUS, N_CELLS).tolist()
+        return out
+
+
+def _stats(a: np.ndarray) -> tuple:
+    lo, hi = a.min(), a.max()
+    return lo, hi, a.mean(), hi - lo
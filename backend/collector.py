@@ -0,0 +1,82 @@
+"""Local stand-in for the remote telemetry collector, for testing the uplink.
+
+    python collector.py                      # listens on :8100
+    TELEMETRY_UPLINK_URL=http://localhost:8100/ingest python main.py
+
+Batches are appended per session to COLLECTOR_DIR/<session>.jsonl.
+COLLECTOR_DROP_RATE (0..1) makes that share of uploads fail with a 503, to
+exercise retry and backoff."""
+
+import gzip
+import os
+import random
+import re
+
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request
+
+
+DATA_DIR = os.environ.get("COLLECTOR_DIR", os.path.join(os.path.dirname(__file__), "collected"))
+DROP_RATE = float(os.environ.get("COLLECTOR_DROP_RATE", 0))
+SESSION_RE = re.compile(r"[0-9a-f]{32}")
+
+app = FastAPI(title="Telemetry Collector")
+
+
+def _paths(session: str):
+    if not SESSION_RE.fullmatch(session):
+        raise HTTPException(status_code=400, detail="bad session")
+    base = os.path.join(DATA_DIR, session)
+    return base + ".jsonl", base + ".offset"
+
+
+def received_up_to(session: str) -> int:
+    _, offset_path = _paths(session)
+    if not os.path.exists(offset_path):
+        return 0
+    with open(offset_path) as f:
+        return int(f.read().strip() or 0)
+
+
+@app.post("/ingest")
+async def ingest(request: Request):
+    """Store one batch, acknowledging the spool offset we now hold up to"""
+    if random.random() < DROP_RATE:
+        raise HTTPException(status_code=503, detail="dropped for testing")
+
+    session = request.headers.get("x-session", "")
+    data_path, offset_path = _paths(session)
+    try:
+        start = int(request.headers["x-spool-start"])
+        end = int(request.headers["x-spool-end"])
+        body = await request.body()
+        if request.headers.get("content-encoding") == "gzip":
+            body = gzip.decompress(body)
+    except (KeyError, ValueError, OSError, EOFError):
+        raise HTTPException(status_code=400, detail="bad batch")
+    if len(body) != end - start:
+        raise HTTPException(status_code=400, detail="length mismatch")
+
+    known = received_up_to(session)
+    if start < known:
+        body = body[known - start:]  # resent after a lost ack
+    elif start > known:
+        print(f"{session}: gap {known} -> {start}")
+
+    if body:
+        os.makedirs(DATA_DIR, exist_ok=True)
+        with open(data_path, "ab") as f:
+            f.write(body)
+        with open(offset_path, "w") as f:
+            f.write(str(end))
+
+    return {"ack": max(end, known)}
+
+
+@app.get("/ack/{session}")
+async def get_ack(session: str):
+    return {"ack": received_up_to(session)}
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="0.0.0.0", port=8100, log_level="info")
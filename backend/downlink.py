@@ -11,6 +11,12 @@ BAUD_RATE = 115200
 TIMEOUT = 1
 HEADER = b'\xDE\xAD\xBE\xEF'  ## same HEADER as sender ##
 
+# Computed here rather than sent by the car
+DERIVED_KEYS = {
+    'A': ('Power_A', 'Power_B', 'Power_C', 'Power_D', 'Solar_Power', 'Bus_Power'),
+    'B': (),
+}
+
 logpath = "/Users/kevinkinsey/Developer/Agnirath/d2/log"
 
 
@@ -156,14 +162,19 @@ def log_data(data_buf, type):
             writer.writerow(headers)
         writer.writerow(row_data)
 
-def main(queue, loop):
-    ser = serial.Serial(SERIAL_PORT, BAUD_RATE, timeout=TIMEOUT)
-
+def load_structure():
     current_dir = os.path.dirname(__file__)
     json_path = os.path.join(current_dir, 'packet_structure.json')
 
     with open(json_path, 'r') as f:
-        structure = json.load(f)
+        return json.load(f)
+
+
+def run(publish):
+    """Read, decode and log packets forever, handing (type, data_buf) to `publish`"""
+    ser = serial.Serial(SERIAL_PORT, BAUD_RATE, timeout=TIMEOUT)
+
+    structure = load_structure()
 
     flags = structure["Flags"]
     fields = structure["Fields"]
@@ -212,10 +223,14 @@ def main(queue, loop):
             print(f"Type is {packet['type']}, doesn't match any known type")
             continue
 
-        loop.call_soon_threadsafe(queue.put_nowait, (packet['type'], data_buf))
+        publish((packet['type'], data_buf))
 
         log_data(data_buf, packet['type'])
 
 
+def main(queue, loop):
+    run(lambda item: loop.call_soon_threadsafe(queue.put_nowait, item))
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,164 @@
+import asyncio
+import multiprocessing as mp
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from downlink import DERIVED_KEYS, load_structure, run as run_downlink
+
+
+RING_SLOTS = 1024
+# Spawned, not forked: the web process already runs threads (and holds the
+# listening socket) by the time ingest starts
+MP_CONTEXT = mp.get_context("spawn")
+HEADER_BYTES = 64           # write sequence, padded to a cache line
+PACKET_TYPES = ('A', 'B')
+
+
+def record_dtype(structure: dict, ptype: str) -> np.dtype:
+    """Fixed record layout for one packet type, following its Output_Order.
+
+    Values are stored already scaled, so anything with a multiplier (and
+    every float) is kept as float64; unscaled ints stay ints."""
+    fields = structure["Fields"]
+    layout = []
+    for key in structure[f"Output_Order_{ptype}"]:
+        if key == "Flags":
+            layout += [(flag, '?') for flag in structure["Flags"]]
+        elif fields[key]["type"].startswith("int") and "multiplier" not in fields[key]:
+            layout.append((key, '<i4'))
+        else:
+            layout.append((key, '<f8'))
+    layout += [(key, '<f8') for key in DERIVED_KEYS[ptype]]
+    return np.dtype(layout)
+
+
+class ShmRing:
+    """Single-producer ring of decoded frames in shared memory.
+
+    Slot sequence numbers act as a seqlock: a reader that finds a slot's
+    sequence changed under it (the writer lapped us) drops that frame
+    rather than decode a torn record."""
+
+    def __init__(self, shm: shared_memory.SharedMemory, slots: int, structure: dict):
+        self.shm = shm
+        self.n = slots
+        self.records = [record_dtype(structure, t) for t in PACKET_TYPES]
+        payload = max(r.itemsize for r in self.records)
+        self.slot_dtype = np.dtype([('seq', '<u8'), ('type', 'u1'), ('payload', 'u1', payload)])
+
+        self.header = np.ndarray((1,), dtype='<u8', buffer=shm.buf)
+        self.slots = np.ndarray((slots,), dtype=self.slot_dtype, buffer=shm.buf, offset=HEADER_BYTES)
+        self._scratch = [np.zeros(1, dtype=r) for r in self.records]
+
+        self.next_seq = 1
+        self.overruns = 0
+
+    @staticmethod
+    def size(slots: int, structure: dict) -> int:
+        payload = max(record_dtype(structure, t).itemsize for t in PACKET_TYPES)
+        return HEADER_BYTES + slots * np.dtype([('seq', '<u8'), ('type', 'u1'), ('payload', 'u1', payload)]).itemsize
+
+    def publish(self, item):
+        """Writer side: store one (type, data_buf) frame"""
+        ptype, data = item
+        t = PACKET_TYPES.index(ptype)
+        scratch = self._scratch[t]
+        scratch[0] = tuple(data.get(name, 0) for name in scratch.dtype.names)
+
+        seq = int(self.header[0]) + 1
+        slot = self.slots[seq % self.n]
+        slot['seq'] = 0
+        slot['type'] = t
+        slot['payload'][:scratch.itemsize] = scratch.view('u1')
+        slot['seq'] = seq
+        self.header[0] = seq
+
+    def drain(self) -> list:
+        """Reader side: every frame published since the last call"""
+        head = int(self.header[0])
+        if head - self.next_seq >= self.n:
+            self.overruns += head - self.next_seq - self.n + 1
+            self.next_seq = head - self.n + 1
+
+        frames = []
+        while self.next_seq <= head:
+            seq = self.next_seq
+            self.next_seq += 1
+
+            slot = self.slots[seq % self.n]
+            before = int(slot['seq'])
+            t = int(slot['type'])
+            payload = slot['payload'].copy()
+            if before != seq or int(slot['seq']) != seq:
+                self.overruns += 1
+                continue
+
+            record = self.records[t]
+            values = payload[:record.itemsize].view(record)[0].item()
+            frames.append((PACKET_TYPES[t], dict(zip(record.names, values))))
+        return frames
+
+
+def _ingest_process(shm_name: str, slots: int, doorbell):
+    """Child process: serial read, decode and logging, frames into the ring"""
+    structure = load_structure()
+    shm = shared_memory.SharedMemory(name=shm_name)
+    ring = ShmRing(shm, slots, structure)
+
+    fd = doorbell.fileno()
+    os.set_blocking(fd, False)
+
+    def publish(item):
+        ring.publish(item)
+        try:
+            os.write(fd, b'\x01')
+        except BlockingIOError:
+            pass  # reader hasn't caught up, the bell is already ringing
+
+    run_downlink(publish)
+
+
+class IngestProcess:
+    """Runs downlink in its own process and feeds the event loop queue.
+
+    The doorbell is a pipe the event loop watches with add_reader, so the
+    web process never polls the ring (needs a selector loop, i.e. not
+    Windows' proactor)."""
+
+    def __init__(self, slots: int = RING_SLOTS):
+        self.slots = slots
+        structure = load_structure()
+        self.shm = shared_memory.SharedMemory(create=True, size=ShmRing.size(slots, structure))
+        self.ring = ShmRing(self.shm, slots, structure)
+        self.bell_r, self.bell_w = MP_CONTEXT.Pipe(duplex=False)
+        self.process = MP_CONTEXT.Process(
+            target=_ingest_process,
+            args=(self.shm.name, slots, self.bell_w),
+            daemon=True,
+        )
+
+    def start(self, queue: asyncio.Queue, loop: asyncio.AbstractEventLoop):
+        fd = self.bell_r.fileno()
+
+        def on_doorbell():
+            try:
+                os.read(fd, 4096)
+            except BlockingIOError:
+                pass
+            for frame in self.ring.drain():
+                queue.put_nowait(frame)
+
+        os.set_blocking(fd, False)
+        loop.add_reader(fd, on_doorbell)
+        self._loop = loop
+        self.process.start()
+
+    def stop(self):
+        self._loop.remove_reader(self.bell_r.fileno())
+        self.process.terminate()
+        self.process.join(timeout=2)
+        del self.ring
+        self.shm.close()
+        self.shm.unlink()
@@ -1,7 +1,5 @@
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
 import os
 
 import asyncio
@@ -14,170 +12,136 @@ import uvicorn
 from contextlib import asynccontextmanager
 import threading
 import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from pprint import pprint 
 
 from downlink import main as run_downlink
+from ingest import IngestProcess
+from static import PrecompressedStatic
+from track import TrackService
+from topics import METRIC_TOPICS, HISTORIC_PREFIX, compose, expand, fragment
+from metric_state import MetricState
+from uplink import Uplink
+import strategy
+
+# Initial metric values, the live copy is kept compactly in `state`
+DEFAULT_METRIC = {
+    'Pack_Voltage': 48.2,
+    'SOC_Ah': 12000,
+    'power_consumption': 1250.0,
+    'solar_input': 450.0,
+    'distance_travelled': 142.8,
+    'Motor_Temp': 68.5,
+    'Speed': 65.4,
+    'predicted': 67.2,
+
+    'Pack_Current': 46.26,
+    'cmus': [{
+        'temperature': 30.12,
+        'cell_temperature': 30.12,
+        'cell_voltages': [3.7 for _ in range(8)]
+    } for _ in range(5)],
+    'battery_ranges': {
+        'min_temp': 0,
+        'max_temp': 0,
+        'min_volt': 0,
+        'max_volt': 0,
+    },
+    'precharge_state': 0,
+    'contactor_flags': {
+        'contactor1_error': False,
+        'contactor2_error': False,
+        'contactor3_error': False,
+        'contactor1_output': False,
+        'contactor2_output': False,
+        'contactor3_output': False,
+
+        'contactor_supply': False,
+    },
+    'bmsFlags': {
+        'cell_over_voltage': False,
+        'cell_under_voltage': False,
+        'cell_over_temp': False,
+        'measurement_untrusted': False,
+        'cmu_comm_timeout': False,
+        'vehicle_comm_timeout': False,
+        'bms_setup_mode': False,
+        'cmu_can_status': False,
+        'isolation_test_fail': False,
+        'soc_invalid': False,
+        'can_supply_low': False,
+        'contactor_not_engaged': False,
+        'extra_cell_detected': False,
+    },
 
-# Key Lists
-PACKET_A_DIRECT_KEYS = ("SOC_Ah", "Pack_Voltage", "Pack_Current", "Bus_Voltage",
-                        "Bus_Current", "Motor_Velocity", "PhaseC_Current",
-                        "PhaseB_Current", "Speed",)
-MPPT_NAMES = ('A', 'B', 'C', 'D')
-MPPT_VALUE_KEYS = ("Input_Voltage", "Input_Current",
-                        "Output_Voltage", "Output_Current")
-MPPT_FLAG_NAMES = (
-    'hw_overvolt', 'hw_overcurrent', None, 'under12v',
-    'battery_full', 'battery_low',
-    'mosfet_overheat', 'low_array_power'
-)
-CONTACTOR_FLAG_NAMRS = (
-    'contactor1_error', 'contactor2_error',
-    'contactor1_output', 'contactor2_output',
-    'contactor_supply',
-    'contactor3_error', 'contactor3_output',
-    None
-)
-BMS_FLAG_NAMES = (
-    "cell_over_voltage", "cell_under_voltage", "cell_over_temp",
-    "measurement_untrusted", "cmu_comm_timeout", "vehicle_comm_timeout",
-    "bms_setup_mode", "cmu_can_status", "isolation_test_fail", "soc_invalid",
-    "can_supply_low", "contactor_not_engaged", "extra_cell_detected",
-)
-MOTOR_LIMIT_NAMES = (
-    'ipm_temp_limit', 'bus_voltage_lower_limit',
-    'bus_voltage_upper_limit', 'bus_current_limit',
-    'velocity_limit', 'motor_current_limit',
-    'output_voltage_pwm_limit',
-)
-MOTOR_ERROR_NAMES = (
-    'hardware_over_current','software_over_current', 'dc_bus_over_voltage', 
-    'bad_motor_position', 'watchdog_reset', 'config_read_error',
-    'rail_15v_uvlo', 'desaturation_fault', 'motor_over_speed', 
-)
-CABIN_FLAG_NAMES = (  ## TODO
-    'Cabin_CO_Content', 'Cabin_CH4_Content',
-    'Cabin_NH3_Content', 'Cabin_NO2_Content',
-    'Cabin_O2_Content', 'Cabin_Temperature',
-    'Cabin_Pressure', 'Cabin_CO2_Content',
-)
-PACKET_B_DIRECT_KEYS = ("Motor_Temp", "HeatSink_Temp", "DSP_Board_Temp",)
 
+    'Motor_Velocity': 123,
+    'Speed2': 75,
+    'HeatSink_Temp': 31,
+    'PhaseA_Current': 45.65,
+    'PhaseB_Current': 45.6,
+    'PhaseC_Current': 45.7,
+    'Bus_Voltage': 50,
+    'Bus_Current': 45,
+    'Bus_Power': 50 * 45,
+    'DSP_Board_Temp': 0,
+    'MotorLimits': {
+        'ipm_temp_limit': False,
+        'bus_voltage_lower_limit': False,
+        'bus_voltage_upper_limit': False,
+        'bus_current_limit': False,
+        'velocity_limit': False,
+        'motor_current_limit': False,
+        'output_voltage_pwm_limit': False,
+    },
+    'MotorErrors': {
+        'motor_over_speed': False,
+        'desaturation_fault': False,
+        'rail_15v_uvlo': False,
+        'config_read_error': False,
+        'watchdog_reset': False,
+        'bad_motor_position': False,
+        'dc_bus_over_voltage': False,
+        'software_over_current': False,
+        'hardware_over_current': False,
+    },
+
+    'mppts': [{
+        'Input_Voltage': 50,
+        'Input_Current': 45,
+        'Output_Voltage': 50,
+        'Output_Current': 45,
+        'Output_Power': 50 * 45,
+        'efficiency': 98,
+
+        'Mosfet_Temperature': 35,
+        'MPPT_Temperature': 35,
+        'flags': {
+            'hw_overvolt': False,
+            'hw_overcurrent':  False,
+            'under12v': False,
+            'low_array_power': False,
+            'battery_full': False,
+            'battery_low': False,
+            'mosfet_overheat': False,
+        }
+    } for _ in range(4)],
+
+    'CabinSensors': {
+        'Cabin_CO_Content': 0.2,
+        'Cabin_CH4_Content': 3,
+        'Cabin_NH3_Content': 4,
+        'Cabin_NO2_Content': 5,
+        'Cabin_O2_Content': 6,
+        'Cabin_Temperature': 35,
+        'Cabin_Pressure': 76,
+        'Cabin_CO2_Content': 2,
+    }
+}
 
 # Global state to store current data
 current_data = {
-    "metric": {
-        'Pack_Voltage': 48.2,
-        'SOC_Ah': 12000,
-        'power_consumption': 1250.0,
-        'solar_input': 450.0,
-        'distance_travelled': 142.8,
-        'Motor_Temp': 68.5,
-        'Speed': 65.4,
-        'predicted': 67.2,
-
-        'Pack_Current': 46.26,
-        'cmus': [{
-            'temperature': 30.12,
-            'cell_temperature': 30.12,
-            'cell_voltages': [3.7 for _ in range(8)]
-        } for _ in range(5)],
-        'battery_ranges': {
-            'min_temp': 0,
-            'max_temp': 0,
-            'min_volt': 0,
-            'max_volt': 0,
-        },
-        'precharge_state': 0,
-        'contactor_flags': {
-            'contactor1_error': False,
-            'contactor2_error': False,
-            'contactor3_error': False,
-            'contactor1_output': False,
-            'contactor2_output': False,
-            'contactor3_output': False,
-
-            'contactor_supply': False,
-        },
-        'bmsFlags': {
-            'cell_over_voltage': False,
-            'cell_under_voltage': False,
-            'cell_over_temp': False,
-            'measurement_untrusted': False,
-            'cmu_comm_timeout': False,
-            'vehicle_comm_timeout': False,
-            'bms_setup_mode': False,
-            'cmu_can_status': False,
-            'isolation_test_fail': False,
-            'soc_invalid': False,
-            'can_supply_low': False,
-            'contactor_not_engaged': False,
-            'extra_cell_detected': False,
-        },
-
-
-        'Motor_Velocity': 123,
-        'Speed2': 75,
-        'HeatSink_Temp': 31,
-        'PhaseA_Current': 45.65,
-        'PhaseB_Current': 45.6,
-        'PhaseC_Current': 45.7,
-        'Bus_Voltage': 50,
-        'Bus_Current': 45,
-        'Bus_Power': 50 * 45,
-        'DSP_Board_Temp': 0,
-        'MotorLimits': {
-            'ipm_temp_limit': False,
-            'bus_voltage_lower_limit': False,
-            'bus_voltage_upper_limit': False,
-            'bus_current_limit': False,
-            'velocity_limit': False,
-            'motor_current_limit': False,
-            'output_voltage_pwm_limit': False,
-        },
-        'MotorErrors': {
-            'motor_over_speed': False,
-            'desaturation_fault': False,
-            'rail_15v_uvlo': False,
-            'config_read_error': False,
-            'watchdog_reset': False,
-            'bad_motor_position': False,
-            'dc_bus_over_voltage': False,
-            'software_over_current': False,
-            'hardware_over_current': False,
-        },
-    
-        'mppts': [{
-            'Input_Voltage': 50,
-            'Input_Current': 45,
-            'Output_Voltage': 50,
-            'Output_Current': 45,
-            'Output_Power': 50 * 45,
-            'efficiency': 98,
-
-            'Mosfet_Temperature': 35,
-            'MPPT_Temperature': 35,
-            'flags': {
-                'hw_overvolt': False,
-                'hw_overcurrent':  False,
-                'under12v': False,
-                'low_array_power': False,
-                'battery_full': False,
-                'battery_low': False,
-                'mosfet_overheat': False,
-            }
-        } for _ in range(4)],
-
-        'CabinSensors': {
-            'Cabin_CO_Content': 0.2,
-            'Cabin_CH4_Content': 3,
-            'Cabin_NH3_Content': 4,
-            'Cabin_NO2_Content': 5,
-            'Cabin_O2_Content': 6,
-            'Cabin_Temperature': 35,
-            'Cabin_Pressure': 76,
-            'Cabin_CO2_Content': 2,
-        }
-    },
     "historic": {
         'Timestamps': [],
         'Speed': [],
@@ -192,241 +156,263 @@ current_data = {
         'solar_output_power': [],
         'Acceleration': [],
         'Altitude': [],
-        'Latitudes': [-12.446822],
-        'Longitudes': [130.907036],
-    }
+    },
+    "strategy": {'status': 'insufficient data'},
 }
 
+STRATEGY_PERIOD = 1.0  # seconds between strategy refits
+
+# "thread" keeps serial ingest in this process, "process" moves it out of
+# the GIL and hands frames over through shared memory
+INGEST_MODE = os.environ.get("TELEMETRY_INGEST", "thread")
+
+# Path to Svelte build output, set TELEMETRY_SERVE_UI=0 when using the vite dev server
+frontend_dir = os.path.join(os.path.dirname(__file__), "prodbuild")
+SERVE_UI = os.environ.get("TELEMETRY_SERVE_UI", "1") == "1"
+ui = PrecompressedStatic(frontend_dir) if SERVE_UI and os.path.isdir(frontend_dir) else None
+
+# Remote collector to replicate decoded frames to, off when unset. Created in
+# lifespan, worker processes re-import this module and must not open the spool.
+UPLINK_URL = os.environ.get("TELEMETRY_UPLINK_URL")
+UPLINK_SPOOL = os.environ.get("TELEMETRY_UPLINK_SPOOL", os.path.join(os.path.dirname(__file__), "spool"))
+uplink = None
+
+state = MetricState(DEFAULT_METRIC)
+
+# GPS route, kept out of `historic` so new clients get the simplified polyline
+track = TrackService()
+
 # WebSocket connection manager
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: list[WebSocket] = []
+        self.active_connections: dict[WebSocket, set[str]] = {}
+        self.subscribers: dict[str, int] = {}
 
-    async def connect(self, websocket: WebSocket):
+    async def connect(self, websocket: WebSocket, topics: set[str]):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        self.active_connections[websocket] = set()
+        self.subscribe(websocket, topics)
 
     def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-
-    async def broadcast(self, message: str):
+        """Forget a client, safe to call again once broadcast() dropped it"""
+        topics = self.active_connections.pop(websocket, None)
+        if topics is None:
+            return
+        for topic in topics:
+            self.subscribers[topic] -= 1
+
+    def subscribe(self, websocket: WebSocket, topics: set[str]) -> set[str]:
+        """Add topics to a client, returns the ones it didn't have yet"""
+        current = self.active_connections.get(websocket)
+        if current is None:
+            return set()
+        new = topics - current
+        current |= new
+        for topic in new:
+            self.subscribers[topic] = self.subscribers.get(topic, 0) + 1
+        return new
+
+    def unsubscribe(self, websocket: WebSocket, topics: set[str]):
+        current = self.active_connections.get(websocket, set())
+        old = topics & current
+        current -= old
+        for topic in old:
+            self.subscribers[topic] -= 1
+
+    def wanted(self, topics) -> set[str]:
+        """Topics that at least one client is subscribed to"""
+        return {topic for topic in topics if self.subscribers.get(topic)}
+
+    async def broadcast(self, fragments: dict[str, str]):
+        """Send each client the fragments of its subscribed topics. Clients
+        with the same subscriptions share one composed message."""
+        messages = {}
         disconnected = []
-        for connection in self.active_connections:
+        for connection, topics in list(self.active_connections.items()):
+            keys = frozenset(topics.intersection(fragments))
+            if not keys:
+                continue
+            if keys not in messages:
+                messages[keys] = compose("update", {t: fragments[t] for t in keys})
             try:
-                await connection.send_text(message)
+                await connection.send_text(messages[keys])
             except:
                 disconnected.append(connection)
         
         # Remove disconnected clients
         for conn in disconnected:
-            self.active_connections.remove(conn)
+            self.disconnect(conn)
 
 manager = ConnectionManager()
 
+# (version, fragment) last broadcast per metric topic, to skip unchanged ones
+last_sent: dict[str, tuple[int, str]] = {}
+
+def topic_value(topic: str, update: bool = False):
+    """Current value of a topic, `update` gives the incremental form (latest
+    point of a historic series instead of the whole series)"""
+    if topic in METRIC_TOPICS:
+        return state.view(topic)
+    if topic.startswith(HISTORIC_PREFIX):
+        series = current_data['historic'][topic[len(HISTORIC_PREFIX):]]
+        return series[-1] if update else series
+    if topic == 'track':
+        return track.update() if update else track.snapshot()
+    return current_data[topic]
+
+def snapshot(topics: set[str]) -> str:
+    """Full 'data' message for the given topics"""
+    return compose("data", {topic: fragment(topic, topic_value(topic)) for topic in topics})
+
+async def publish(changed: set[str]):
+    """Broadcast the changed topics that have subscribers"""
+    fragments = {}
+    for topic in manager.wanted(changed):
+        if topic in METRIC_TOPICS:
+            version = state.versions[topic]
+            sent_version, sent = last_sent.get(topic, (None, None))
+            if sent_version == version:
+                continue
+            frag = fragment(topic, state.view(topic))
+            last_sent[topic] = (version, frag)
+            if frag == sent:
+                continue
+        else:
+            frag = fragment(topic, topic_value(topic, update=True))
+        fragments[topic] = frag
+
+    if fragments:
+        await manager.broadcast(fragments)
+
 async def update_processor(queue: asyncio.Queue):
     """Background task that waits for data update events and broadcasts"""
     try:
-        count = 0
         while True:
             (ptype, pdata) = await queue.get()
-            # await asyncio.sleep(1)
 
-            update_packet = {"type": "update"}
-            metric = current_data['metric']
-            # ptype = 'None'
-            # count += 1
-            # metric['Speed'] = count % 10
-
-            # if(count > 10):
-            #     metric['bmsFlags']['cell_over_voltage'] = True
-            # print( ptype, pdata)
+            changed = state.update(ptype, pdata)
+            if uplink:
+                uplink.submit(ptype, pdata)
 
             if ptype == "A":
-                # Direct data
-                for k in PACKET_A_DIRECT_KEYS:
-                    metric[k] = pdata[k]
-                
-                # Direct data - reorganised
-                mppts = []
-                solar_o = 0
-                solar_i_v = 0
-                for i, old in zip(MPPT_NAMES, current_data['metric']['mppts']):
-                    d = {k: pdata[k + f"_{i}"]
-                        for k in MPPT_VALUE_KEYS}
-                    
-                    # Immeditate bugfix
-                    # if(d['Input_Voltage'] < 0):
-                    #     d['Input_Voltage'] = old['Input_Voltage']
-                    
-                    d['Output_Power'] = ds_o = d['Output_Voltage'] * d['Output_Current']
-                    # d['Output_Power'] = ds_o = d['Input_Voltage'] * d['Input_Current']
-                    solar_o +=  ds_o
-                    solar_i_v += d['Input_Voltage']
-            
-                    d['efficiency'] = 100 * ds_o / max(d['Input_Voltage'] * d['Input_Current'], 0.00001)
-                    d['efficiency'] = max(0, d['efficiency'])
-
-                    d['Mosfet_Temperature'] = old['Mosfet_Temperature']
-                    d['MPPT_Temperature'] = old['MPPT_Temperature']
-
-                    d['flags'] = {
-                        key: pdata[F"MPPT_{i}_Flag{j+1}"]
-                        for j, key in enumerate(MPPT_FLAG_NAMES) if key
-                    }
-                    mppts.append(d)
-                
-                metric['mppts'] = mppts
-                solar_i_v /= 4
-
-                # Flags
-                metric['precharge_state'] = sum(i * pdata[f'Precharge_State_Flag{i}'] for i in range(1, 6))
-                metric['contactor_flags'] = {
-                    key: pdata[f"Precharge_Contactor_Flag{j+1}"]
-                    for j, key in enumerate(CONTACTOR_FLAG_NAMRS) if key
-                }
-                metric['bmsFlags'] = {
-                    key: pdata[f"BMS_Flag{j+1}"]
-                    for j, key in enumerate(BMS_FLAG_NAMES) if key
-                }
-                metric['MotorLimits'] = {
-                    key: pdata[f"MC_Limit_Flag{j+1}"]
-                    for j, key in enumerate(MOTOR_LIMIT_NAMES) if key          
-                }
-                metric['MotorErrors'] = {
-                    key: pdata[f"MC_Error_Flag{j+1}"]
-                    for j, key in enumerate(MOTOR_ERROR_NAMES) if key          
-                }
-
-                # Derived data
-                metric['PhaseA_Current'] = phase_a_current = (metric['PhaseB_Current'] + metric['PhaseB_Current']) / 2.0
-                metric['power_consumption'] = output_power = pdata['Pack_Voltage'] * pdata['Pack_Current']
-                metric['Bus_Power'] = b_output_power = pdata['Bus_Voltage'] * pdata['Bus_Current']
-                metric['Speed2'] = pdata['Vehicle_Velocity']
-                metric['solar_input'] = solar_o
-
                 historic = {
                     'Timestamps': pdata['Timestamp'],
                     'Speed': pdata['Speed'],
                     'Battery': pdata['SOC_Ah'],
-                    'Power': output_power,
-                    'Solar': solar_o,
-                    'Bus_Power': b_output_power,
+                    'Power': state.get('power_consumption'),
+                    'Solar': state.get('solar_input'),
+                    'Bus_Power': state.get('Bus_Power'),
                     'Motor_Velocity': pdata['Motor_Velocity'],
                     'Speed2': pdata['Vehicle_Velocity'],
 
-                    'PhaseA_Current': phase_a_current,
+                    'PhaseA_Current': state.get('PhaseA_Current'),
 
-                    'solar_input_voltage': solar_i_v,
-                    'solar_output_power': solar_o,
+                    'solar_input_voltage': float(state.mppts[:, 0].mean()),
+                    'solar_output_power': state.get('solar_input'),
 
                     'Altitude': pdata['Altitude'],
                     'Acceleration': math.sqrt(sum(pdata[f'acc_{i}']**2 for i in ('X', 'Y'))),
-                    'Latitudes': pdata['Latitude'],
-                    'Longitudes': pdata['Longitude'],
                 }
 
                 for k in current_data['historic']:
                     if k in historic:
                         current_data['historic'][k].append(historic[k])
+                        changed.add(HISTORIC_PREFIX + k)
 
-                update_packet['historic'] = historic
-            
-            if ptype == 'B':
-                for k in PACKET_B_DIRECT_KEYS:
-                    metric[k] = pdata[k]
-                
-                mppts = []
-                for i, old in zip(MPPT_NAMES, current_data['metric']['mppts']):
-                    mppts.append({
-                        **old,
-                        'Mosfet_Temperature': pdata[f'Mosfet_Temp_{i}'],
-                        'MPPT_Temperature': min(pdata[f'Controller_Temp_{i}'], 100),
-                    })
-                metric['mppts'] = mppts
-                
-                metric['cmus'] = []
-                output_power = 0
-                
-                # minTemp, maxTemp = float('inf'), -float('inf')
-                # minVolt, maxVolt = float('inf'), -float('inf')
-                
-                minTemp, maxTemp = 100, -100
-                minVolt, maxVolt = 100, -100
-
-                for i in range(1, 6):
-                    d = {
-                        "temperature": pdata[f"CMU{i}_Temp"],
-                        "cell_temperature": pdata[f"Cell{i}_Temp"],
-                    }
-                    minTemp = min(minTemp, d['temperature'], d['cell_temperature'])
-                    maxTemp = max(maxTemp, d['temperature'], d['cell_temperature'])
-
-                    d['cell_voltages'] = [pdata[f"CMU{i}_Cell{j}_Voltage"] for j in range(8)]
-                    minVolt = min(minVolt, min(d['cell_voltages']))
-                    maxVolt = max(maxVolt, max(d['cell_voltages']))
-
-                    metric['cmus'].append(d)
-
-                metric['battery_ranges'] = {
-                    'min_temp': minTemp,
-                    'max_temp': maxTemp,
-                    'min_volt': minVolt,
-                    'max_volt': maxVolt,
-                }
-
-                metric['CabinSensors'] = {
-                    key: pdata[key]
-                    for key in CABIN_FLAG_NAMES       
-                }
-                
-            current_data['metric'] = update_packet['metric'] = metric
+                track.append(pdata['Latitude'], pdata['Longitude'], pdata['Timestamp'])
+                changed.add('track')
 
             # Broadcast update =====================================
             print("broadcasting")
-            await manager.broadcast(json.dumps(update_packet, default=lambda o: "Infinity" if o == float('inf') 
-                  else "-Infinity" if o == float('-inf') 
-                  else "NaN" if o != o  # NaN check
-                  else None))
-            # pprint(update_packet)
+            await publish(changed)
     
     except Exception as e:
         print(f"PRocessor crashed: {e}")
         traceback.print_exc()
         raise
 
+async def strategy_processor(pool: ProcessPoolExecutor):
+    """Background task that refits the strategy model and pushes `predicted`"""
+    engine = strategy.StrategyEngine()
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            await asyncio.sleep(STRATEGY_PERIOD)
+
+            engine.ingest(current_data['historic'])
+            args = engine.request(current_data['historic'], state.view('overview'))
+            if args is None:
+                continue
+
+            predicted, diag = await loop.run_in_executor(pool, strategy.solve, *args)
+            current_data['strategy'] = diag
+            if predicted is None:
+                await publish({'strategy'})
+                continue
+
+            state.set('predicted', predicted)
+            await publish({'overview', 'strategy'})
+
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        print(f"Strategy crashed: {e}")
+        traceback.print_exc()
+        raise
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Initialize data and start background tasks"""
-    
+    global uplink
+
+    if ui:
+        ui.load()
+
     queue = asyncio.Queue()
 
     # Store the event loop for cross-thread communication
     loop = asyncio.get_event_loop()
     t1 = asyncio.create_task(update_processor(queue))
 
-    thread =  threading.Thread(
-        target=run_downlink,
-        args=(queue, loop),
-        daemon=True
-    )
-    thread.start()
+    # Model fitting runs out of process so it never stalls the event loop.
+    # The worker starts lazily, once the ingest/uplink threads are running,
+    # so it must not be forked from this process.
+    pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("forkserver"))
+    t2 = asyncio.create_task(strategy_processor(pool))
+
+    ingest = None
+    if INGEST_MODE == "process":
+        ingest = IngestProcess()
+        ingest.start(queue, loop)
+    else:
+        thread =  threading.Thread(
+            target=run_downlink,
+            args=(queue, loop),
+            daemon=True
+        )
+        thread.start()
+
+    if UPLINK_URL:
+        uplink = Uplink(UPLINK_URL, UPLINK_SPOOL)
+        uplink.start()
 
     yield
 
     t1.cancel()
+    t2.cancel()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+    if ingest:
+        ingest.stop()
+    if uplink:
+        uplink.stop()
+        uplink = None
 
     # Cancel thread somehow
     return
 
 app = FastAPI(title="Telemetry Dashboard API", lifespan=lifespan)
 
-# # Path to Svelte build output
-# frontend_dir = os.path.join(os.path.dirname(__file__), "prodbuild")
-
-# # Serve static assets
-# app.mount("/_app", StaticFiles(directory=os.path.join(frontend_dir, "_app")), name="_app")
-# app.mount("/assets", StaticFiles(directory=os.path.join(frontend_dir, "assets")), name="assets")
-
 # Enable CORS for Svelte frontend
 app.add_middleware(
     CORSMiddleware,
@@ -436,42 +422,73 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# @app.get("/")
-# async def root():
-#     return FileResponse(os.path.join(frontend_dir, "index.html"))
-
-# # Catch-all for client-side routing
-# @app.get("/{full_path:path}")
-# async def spa_catch_all(full_path: str):
-#     return FileResponse(os.path.join(frontend_dir, "index.html"))
-
 # API Routes
 @app.get("/api/data/historical")
 async def get_historical_data():
     """Get all cached historical data for initial dashboard load"""
     return {
-        'metric': current_data["metric"],
-        'historic': current_data["historic"]
+        'metric': state.metric(),
+        'historic': current_data["historic"],
+        'track': track.snapshot(),
+        'strategy': current_data['strategy'],
     }
 
+@app.get("/api/track")
+async def get_track(min_lat: float, min_lon: float, max_lat: float, max_lon: float, zoom: float | None = None):
+    """Full resolution route inside a bbox, simplified for the given map zoom"""
+    return track.query(min_lat, min_lon, max_lat, max_lon, zoom)
+
+@app.get("/api/battery/history")
+async def get_battery_history(cells: bool = False):
+    """Recent pack min/max/mean/spread per B frame, per-cell volts with `cells=true`"""
+    return state.battery.history(cells)
+
 @app.websocket("/ws/updates")
 async def websocket_endpoint(websocket: WebSocket):
-    """WebSocket endpoint for real-time updates"""
-    await manager.connect(websocket)
+    """WebSocket endpoint for real-time updates.
+
+    Clients get every topic unless they connect with `?topics=a,b`, and can
+    change that later by sending {"type": "subscribe" | "unsubscribe",
+    "topics": [...]}. Newly subscribed topics are answered with a 'data'
+    snapshot of just those topics, plus every subscribed historic series
+    when a historic one is added."""
+    series = current_data['historic'].keys()
+    requested = websocket.query_params.get('topics')
+    topics = expand(requested.split(',') if requested else ['*'], series)
+
+    await manager.connect(websocket, topics)
     try:
         # Send initial data to new client
-        data = {
-            'type': 'data',
-            'metric': current_data["metric"],
-            "historic": current_data["historic"]
-        }
-        await websocket.send_text(json.dumps(data))
+        await websocket.send_text(snapshot(topics))
         
-        # Keep connection alive and wait for disconnect
         while True:
-            await asyncio.sleep(1)
+            try:
+                message = await websocket.receive_json()
+                action = message['type']
+                topics = expand(message.get('topics', []), series)
+            except (ValueError, KeyError, TypeError, AttributeError):
+                continue
+
+            if action == 'subscribe':
+                new = manager.subscribe(websocket, topics)
+                if any(topic.startswith(HISTORIC_PREFIX) for topic in new):
+                    # Series are paired with Timestamps by index, and the
+                    # client has trimmed the ones it already had, so resend
+                    # them all together
+                    new |= {topic for topic in manager.active_connections.get(websocket, ())
+                            if topic.startswith(HISTORIC_PREFIX)}
+                    new.add(HISTORIC_PREFIX + 'Timestamps')
+                if new:
+                    await websocket.send_text(snapshot(new))
+            elif action == 'unsubscribe':
+                manager.unsubscribe(websocket, topics)
     except WebSocketDisconnect:
         manager.disconnect(websocket)
 
+# Serve the Svelte build (precompressed, cached in memory). Mounted last so
+# the API and websocket routes above take precedence.
+if ui:
+    app.mount("/", ui, name="ui")
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000, log_level="info")
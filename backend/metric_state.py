@@ -0,0 +1,288 @@
+import numpy as np
+
+from battery import BatteryAnalytics
+from strategy import hhmmss_to_seconds
+from topics import METRIC_TOPICS
+
+
+# Key Lists
+PACKET_A_DIRECT_KEYS = ("SOC_Ah", "Pack_Voltage", "Pack_Current", "Bus_Voltage",
+                        "Bus_Current", "Motor_Velocity", "PhaseC_Current",
+                        "PhaseB_Current", "Speed",)
+MPPT_NAMES = ('A', 'B', 'C', 'D')
+MPPT_VALUE_KEYS = ("Input_Voltage", "Input_Current",
+                        "Output_Voltage", "Output_Current")
+MPPT_FLAG_NAMES = (
+    'hw_overvolt', 'hw_overcurrent', None, 'under12v',
+    'battery_full', 'battery_low',
+    'mosfet_overheat', 'low_array_power'
+)
+CONTACTOR_FLAG_NAMRS = (
+    'contactor1_error', 'contactor2_error',
+    'contactor1_output', 'contactor2_output',
+    'contactor_supply',
+    'contactor3_error', 'contactor3_output',
+    None
+)
+BMS_FLAG_NAMES = (
+    "cell_over_voltage", "cell_under_voltage", "cell_over_temp",
+    "measurement_untrusted", "cmu_comm_timeout", "vehicle_comm_timeout",
+    "bms_setup_mode", "cmu_can_status", "isolation_test_fail", "soc_invalid",
+    "can_supply_low", "contactor_not_engaged", "extra_cell_detected",
+)
+MOTOR_LIMIT_NAMES = (
+    'ipm_temp_limit', 'bus_voltage_lower_limit',
+    'bus_voltage_upper_limit', 'bus_current_limit',
+    'velocity_limit', 'motor_current_limit',
+    'output_voltage_pwm_limit',
+)
+MOTOR_ERROR_NAMES = (
+    'hardware_over_current','software_over_current', 'dc_bus_over_voltage',
+    'bad_motor_position', 'watchdog_reset', 'config_read_error',
+    'rail_15v_uvlo', 'desaturation_fault', 'motor_over_speed',
+)
+CABIN_FLAG_NAMES = (  ## TODO
+    'Cabin_CO_Content', 'Cabin_CH4_Content',
+    'Cabin_NH3_Content', 'Cabin_NO2_Content',
+    'Cabin_O2_Content', 'Cabin_Temperature',
+    'Cabin_Pressure', 'Cabin_CO2_Content',
+)
+PACKET_B_DIRECT_KEYS = ("Motor_Temp", "HeatSink_Temp", "DSP_Board_Temp",)
+
+# Compact layout
+SCALAR_KEYS = (
+    'Pack_Voltage', 'SOC_Ah', 'power_consumption', 'solar_input',
+    'distance_travelled', 'Motor_Temp', 'Speed', 'predicted', 'Pack_Current',
+    'precharge_state', 'Motor_Velocity', 'Speed2', 'HeatSink_Temp',
+    'PhaseA_Current', 'PhaseB_Current', 'PhaseC_Current', 'Bus_Voltage',
+    'Bus_Current', 'Bus_Power', 'DSP_Board_Temp',
+)
+INT_KEYS = ('precharge_state',)
+BATTERY_RANGE_KEYS = ('min_temp', 'max_temp', 'min_volt', 'max_volt')
+MPPT_COLUMNS = MPPT_VALUE_KEYS + ('Output_Power', 'efficiency',
+                                  'Mosfet_Temperature', 'MPPT_Temperature')
+CMU_TEMP_KEYS = ('temperature', 'cell_temperature')
+N_CMUS = 5
+N_CELLS = 8
+PRECHARGE_STATES = 5
+
+# numeric blocks, all views into one float64 buffer
+BLOCKS = (
+    ('scalars', (len(SCALAR_KEYS),)),
+    ('battery_ranges', (len(BATTERY_RANGE_KEYS),)),
+    ('mppts', (len(MPPT_NAMES), len(MPPT_COLUMNS))),
+    ('cmu_temps', (N_CMUS, len(CMU_TEMP_KEYS))),
+    ('cell_volts', (N_CMUS, N_CELLS)),
+    ('cabin', (len(CABIN_FLAG_NAMES),)),
+)
+# flag groups, all views into one bool buffer: metric key -> names
+FLAG_GROUPS = (
+    ('contactor_flags', CONTACTOR_FLAG_NAMRS),
+    ('bmsFlags', BMS_FLAG_NAMES),
+    ('MotorLimits', MOTOR_LIMIT_NAMES),
+    ('MotorErrors', MOTOR_ERROR_NAMES),
+)
+
+KEY_TOPIC = {key: topic for topic, keys in METRIC_TOPICS.items() for key in keys}
+
+
+class MetricState:
+    """Live metric state in preallocated arrays, updated in place per packet.
+
+    Packet values are gathered straight into flat numpy buffers through
+    index maps built once from the key lists, derived values are computed
+    with in-place vector ops, and the nested dicts the dashboard expects are
+    only built when a topic is read, cached until that topic changes."""
+
+    def __init__(self, initial: dict):
+        sizes = [int(np.prod(shape)) for _, shape in BLOCKS]
+        self.data = np.zeros(sum(sizes))
+        self._offsets = {}
+        offset = 0
+        for (name, shape), size in zip(BLOCKS, sizes):
+            setattr(self, name, self.data[offset:offset + size].reshape(shape))
+            self._offsets[name] = (offset, shape)
+            offset += size
+
+        flag_sizes = [len(names) for _, names in FLAG_GROUPS]
+        n_mppt_flags = len(MPPT_NAMES) * len(MPPT_FLAG_NAMES)
+        self.flags = np.zeros(sum(flag_sizes) + n_mppt_flags + PRECHARGE_STATES, dtype=bool)
+        self.flag_groups = {}
+        offset = 0
+        for (key, _), size in zip(FLAG_GROUPS, flag_sizes):
+            self.flag_groups[key] = self.flags[offset:offset + size]
+            offset += size
+        self.mppt_flags = self.flags[offset:offset + n_mppt_flags].reshape(len(MPPT_NAMES), -1)
+        self.precharge_flags = self.flags[offset + n_mppt_flags:]
+
+        self.scalar_index = {key: i for i, key in enumerate(SCALAR_KEYS)}
+        self._build_index()
+
+        self.battery = BatteryAnalytics()
+        self._power_in = np.zeros(len(MPPT_NAMES))
+        self._precharge_weights = np.arange(1, PRECHARGE_STATES + 1)
+
+        self.versions = dict.fromkeys(METRIC_TOPICS, 0)
+        self._views = {}
+
+        self.load(initial)
+
+    def _pos(self, block, *idx) -> int:
+        """Position of block[idx] in the flat float buffer"""
+        offset, shape = self._offsets[block]
+        return offset + int(np.ravel_multi_index(idx, shape))
+
+    def _build_index(self):
+        s = self.scalar_index
+        a_keys, a_pos = [], []
+        for k in PACKET_A_DIRECT_KEYS:
+            a_keys.append(k)
+            a_pos.append(self._pos('scalars', s[k]))
+        a_keys.append('Vehicle_Velocity')
+        a_pos.append(self._pos('scalars', s['Speed2']))
+        for row, name in enumerate(MPPT_NAMES):
+            for col, k in enumerate(MPPT_VALUE_KEYS):
+                a_keys.append(f"{k}_{name}")
+                a_pos.append(self._pos('mppts', row, col))
+
+        flag_keys = []
+        flag_keys += [f"Precharge_Contactor_Flag{j+1}" for j in range(len(CONTACTOR_FLAG_NAMRS))]
+        flag_keys += [f"BMS_Flag{j+1}" for j in range(len(BMS_FLAG_NAMES))]
+        flag_keys += [f"MC_Limit_Flag{j+1}" for j in range(len(MOTOR_LIMIT_NAMES))]
+        flag_keys += [f"MC_Error_Flag{j+1}" for j in range(len(MOTOR_ERROR_NAMES))]
+        flag_keys += [f"MPPT_{name}_Flag{j+1}" for name in MPPT_NAMES
+                      for j in range(len(MPPT_FLAG_NAMES))]
+        flag_keys += [f"Precharge_State_Flag{i}" for i in range(1, PRECHARGE_STATES + 1)]
+
+        b_keys, b_pos = [], []
+        for k in PACKET_B_DIRECT_KEYS:
+            b_keys.append(k)
+            b_pos.append(self._pos('scalars', s[k]))
+        for row, name in enumerate(MPPT_NAMES):
+            b_keys += [f'Mosfet_Temp_{name}', f'Controller_Temp_{name}']
+            b_pos += [self._pos('mppts', row, 6), self._pos('mppts', row, 7)]
+        for i in range(N_CMUS):
+            b_keys += [f"CMU{i+1}_Temp", f"Cell{i+1}_Temp"]
+            b_pos += [self._pos('cmu_temps', i, 0), self._pos('cmu_temps', i, 1)]
+            for j in range(N_CELLS):
+                b_keys.append(f"CMU{i+1}_Cell{j}_Voltage")
+                b_pos.append(self._pos('cell_volts', i, j))
+        for j, k in enumerate(CABIN_FLAG_NAMES):
+            b_keys.append(k)
+            b_pos.append(self._pos('cabin', j))
+
+        self._a_keys, self._a_pos = tuple(a_keys), np.array(a_pos)
+        self._flag_keys = tuple(flag_keys)
+        self._b_keys, self._b_pos = tuple(b_keys), np.array(b_pos)
+
+    def load(self, metric: dict):
+        """Fill the arrays from a nested metric dict (the view format)"""
+        for i, key in enumerate(SCALAR_KEYS):
+            self.scalars[i] = metric[key]
+        self.battery_ranges[:] = [metric['battery_ranges'][k] for k in BATTERY_RANGE_KEYS]
+        for row, mppt in enumerate(metric['mppts']):
+            self.mppts[row] = [mppt[k] for k in MPPT_COLUMNS]
+            self.mppt_flags[row] = [bool(k and mppt['flags'][k]) for k in MPPT_FLAG_NAMES]
+        for i, cmu in enumerate(metric['cmus']):
+            self.cmu_temps[i] = [cmu[k] for k in CMU_TEMP_KEYS]
+            self.cell_volts[i] = cmu['cell_voltages']
+        self.cabin[:] = [metric['CabinSensors'][k] for k in CABIN_FLAG_NAMES]
+        for key, names in FLAG_GROUPS:
+            self.flag_groups[key][:] = [bool(k and metric[key][k]) for k in names]
+
+        for topic in self.versions:
+            self.versions[topic] += 1
+
+    def update(self, ptype: str, pdata: dict) -> set:
+        """Apply a decoded packet in place, returns the topics it touched"""
+        if ptype == "A":
+            self.data[self._a_pos] = np.fromiter(map(pdata.__getitem__, self._a_keys),
+                                                 float, len(self._a_keys))
+            self.flags[:] = np.fromiter(map(pdata.__getitem__, self._flag_keys),
+                                        bool, len(self._flag_keys))
+
+            # Derived data
+            m = self.mppts
+            np.multiply(m[:, 2], m[:, 3], out=m[:, 4])
+            np.multiply(m[:, 0], m[:, 1], out=self._power_in)
+            np.maximum(self._power_in, 0.00001, out=self._power_in)
+            np.divide(m[:, 4], self._power_in, out=m[:, 5])
+            m[:, 5] *= 100
+            np.maximum(m[:, 5], 0, out=m[:, 5])
+
+            sc, s = self.scalars, self.scalar_index
+            sc[s['precharge_state']] = self._precharge_weights @ self.precharge_flags
+            sc[s['PhaseA_Current']] = (sc[s['PhaseB_Current']] + sc[s['PhaseB_Current']]) / 2.0
+            sc[s['power_consumption']] = sc[s['Pack_Voltage']] * sc[s['Pack_Current']]
+            sc[s['Bus_Power']] = sc[s['Bus_Voltage']] * sc[s['Bus_Current']]
+            sc[s['solar_input']] = m[:, 4].sum()
+
+            return self._touch('overview', 'mppts', 'motor', 'flags')
+
+        if ptype == "B":
+            self.data[self._b_pos] = np.fromiter(map(pdata.__getitem__, self._b_keys),
+                                                 float, len(self._b_keys))
+            np.minimum(self.mppts[:, 7], 100, out=self.mppts[:, 7])
+
+            self.battery.update(self.cell_volts, self.cmu_temps,
+                                hhmmss_to_seconds(float(pdata['Timestamp'])))
+            self.battery_ranges[:] = self.battery.ranges()
+
+            return self._touch('motor', 'mppts', 'cmus', 'cabin')
+
+        return set()
+
+    def _touch(self, *topics) -> set:
+        for topic in topics:
+            self.versions[topic] += 1
+        return set(topics)
+
+    def get(self, key: str) -> float:
+        return float(self.scalars[self.scalar_index[key]])
+
+    def set(self, key: str, value: float):
+        self.scalars[self.scalar_index[key]] = value
+        self._touch(KEY_TOPIC[key])
+
+    def view(self, topic: str) -> dict:
+        """Nested dict of one topic, rebuilt only when its version moved on"""
+        version = self.versions[topic]
+        cached = self._views.get(topic)
+        if cached and cached[0] == version:
+            return cached[1]
+
+        scalars = self.scalars.tolist()
+        view = {}
+        for key in METRIC_TOPICS[topic]:
+            if key in self.scalar_index:
+                value = scalars[self.scalar_index[key]]
+                view[key] = int(value) if key in INT_KEYS else value
+            else:
+                view[key] = self._nested(key)
+
+        self._views[topic] = (version, view)
+        return view
+
+    def _nested(self, key: str):
+        if key == 'mppts':
+            return [{
+                **dict(zip(MPPT_COLUMNS, row)),
+                'flags': {k: f for k, f in zip(MPPT_FLAG_NAMES, flags) if k},
+            } for row, flags in zip(self.mppts.tolist(), self.mppt_flags.tolist())]
+        if key == 'cmus':
+            return [{
+                **dict(zip(CMU_TEMP_KEYS, temps)),
+                'cell_voltages': volts,
+            } for temps, volts in zip(self.cmu_temps.tolist(), self.cell_volts.tolist())]
+        if key == 'battery_ranges':
+            return dict(zip(BATTERY_RANGE_KEYS, self.battery_ranges.tolist()))
+        if key == 'battery_analytics':
+            return self.battery.summary()
+        if key == 'CabinSensors':
+            return dict(zip(CABIN_FLAG_NAMES, self.cabin.tolist()))
+        names = dict(FLAG_GROUPS)[key]
+        return {k: f for k, f in zip(names, self.flag_groups[key].tolist()) if k}
+
+    def metric(self) -> dict:
+        """The whole metric tree, as served to new clients"""
+        return {key: value for topic in METRIC_TOPICS for key, value in self.view(topic).items()}
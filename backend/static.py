@@ -0,0 +1,144 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, PlainTextResponse, Response
+
+try:
+    import brotli
+except ImportError:  # optional, gzip only without it
+    brotli = None
+
+
+IMMUTABLE_PREFIX = "_app/immutable/"
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "no-cache"
+MEMORY_BUDGET = 64 * 1024 * 1024   # bytes of assets (all variants) kept in memory
+MIN_COMPRESS_SIZE = 256
+COMPRESSIBLE = ("text/", "application/javascript", "application/json",
+                "image/svg+xml", "application/manifest+json")
+
+
+class Asset:
+    __slots__ = ("path", "content_type", "cache_control", "etag", "size", "variants")
+
+    def __init__(self, path, rel_path):
+        self.path = path
+        self.content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if self.content_type.startswith("text/") or self.content_type == "application/javascript":
+            self.content_type += "; charset=utf-8"
+        self.cache_control = IMMUTABLE_CACHE if rel_path.startswith(IMMUTABLE_PREFIX) else REVALIDATE_CACHE
+        self.size = os.path.getsize(path)
+        self.etag = None
+        self.variants = {}  # encoding -> body, empty when served from disk
+
+
+class PrecompressedStatic:
+    """Serves a built SPA from memory.
+
+    Every file is read once at startup, gets a content hash ETag and, for
+    text assets, gzip/brotli variants picked per request by Accept-Encoding.
+    Hashed _app/immutable chunks are cached by browsers for a year; the
+    rest revalidate against the ETag and get a 304. Unknown extensionless
+    paths fall back to index.html for client-side routing.
+
+    Nothing is read until load(), so importing the app (e.g. in a worker
+    process) stays cheap; the first request loads it otherwise."""
+
+    def __init__(self, directory: str, fallback: str = "index.html"):
+        self.directory = directory
+        self.fallback = fallback
+        self.assets: dict[str, Asset] = {}
+        self.loaded = False
+
+    def load(self):
+        if self.loaded:
+            return
+        self.loaded = True
+        budget = MEMORY_BUDGET
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                rel_path = os.path.relpath(path, self.directory).replace(os.sep, "/")
+                asset = Asset(path, rel_path)
+
+                with open(path, "rb") as f:
+                    body = f.read()
+                asset.etag = '"%s"' % hashlib.sha1(body).hexdigest()[:20]
+
+                variants = {"identity": body}
+                if len(body) >= MIN_COMPRESS_SIZE and asset.content_type.startswith(COMPRESSIBLE):
+                    gz = gzip.compress(body, compresslevel=9, mtime=0)
+                    if len(gz) < len(body):
+                        variants["gzip"] = gz
+                    if brotli is not None:
+                        br = brotli.compress(body, quality=11)
+                        if len(br) < len(gz):
+                            variants["br"] = br
+
+                size = sum(len(v) for v in variants.values())
+                if size <= budget:
+                    budget -= size
+                    asset.variants = variants
+
+                self.assets[rel_path] = asset
+
+    def _lookup(self, path: str):
+        path = path.lstrip("/")
+        asset = self.assets.get(path or self.fallback)
+        if asset is None and "." not in path.rsplit("/", 1)[-1]:
+            asset = self.assets.get(self.fallback)
+        return asset
+
+    @staticmethod
+    def _encoding(asset: Asset, accept_encoding: str) -> str:
+        accepted = set()
+        for part in accept_encoding.split(","):
+            coding, _, params = part.strip().partition(";")
+            if params.replace(" ", "") not in ("q=0", "q=0.0"):
+                accepted.add(coding.strip())
+        for encoding in ("br", "gzip"):
+            if encoding in asset.variants and encoding in accepted:
+                return encoding
+        return "identity"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return
+        self.load()
+
+        if scope["method"] not in ("GET", "HEAD"):
+            response = PlainTextResponse("Method Not Allowed", status_code=405)
+            return await response(scope, receive, send)
+
+        asset = self._lookup(scope["path"][len(scope.get("root_path", "")):])
+        if asset is None:
+            return await PlainTextResponse("Not Found", status_code=404)(scope, receive, send)
+
+        headers = Headers(scope=scope)
+        encoding = self._encoding(asset, headers.get("accept-encoding", ""))
+        etag = asset.etag if encoding == "identity" else asset.etag[:-1] + '-' + encoding + '"'
+        response_headers = {
+            "etag": etag,
+            "cache-control": asset.cache_control,
+            "vary": "Accept-Encoding",
+        }
+
+        if_none_match = headers.get("if-none-match", "")
+        if etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(",")):
+            return await Response(status_code=304, headers=response_headers)(scope, receive, send)
+
+        if not asset.variants:
+            response = FileResponse(asset.path, headers=response_headers, media_type=asset.content_type)
+            return await response(scope, receive, send)
+
+        if encoding != "identity":
+            response_headers["content-encoding"] = encoding
+        body = asset.variants[encoding]
+        if scope["method"] == "HEAD":
+            response_headers["content-length"] = str(len(body))
+            body = b""
+        response = Response(body, headers=response_headers, media_type=asset.content_type)
+        await response(scope, receive, send)
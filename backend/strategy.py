@@ -0,0 +1,172 @@
+import math
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+
+
+# Race day parameters (local time, hours)
+DAY_END = float(os.environ.get("STRATEGY_DAY_END", 17.0))
+SUNRISE = float(os.environ.get("STRATEGY_SUNRISE", 7.0))
+SUNSET = float(os.environ.get("STRATEGY_SUNSET", 18.5))
+RESERVE_WH = float(os.environ.get("STRATEGY_RESERVE_WH", 200.0))
+
+V_MIN = 20 / 3.6    # m/s
+V_MAX = 100 / 3.6
+MIN_ROWS = 60       # samples before the fit is trusted
+MAX_GAP_S = 5.0     # consecutive samples further apart than this are not paired
+FORGET = 0.999      # per-sample forgetting factor of the fit
+SOLAR_WINDOW = 30   # samples averaged for the current solar input
+
+# P_drive = c0 + c1*v + c2*v^3 + c3*v*a + c4*dh/dt
+FEATURES = ('static', 'rolling', 'aero', 'inertia', 'climb')
+
+
+def hhmmss_to_seconds(t: np.ndarray) -> np.ndarray:
+    """GPS hhmmss floats -> seconds of day"""
+    return (t // 10000) * 3600 + (t // 100 % 100) * 60 + t % 100
+
+
+def solar_profile(hour: float) -> float:
+    """Clear-sky shape, 0 at sunrise/sunset and 1 at solar noon"""
+    if hour <= SUNRISE or hour >= SUNSET:
+        return 0.0
+    return math.sin(math.pi * (hour - SUNRISE) / (SUNSET - SUNRISE))
+
+
+def solar_forecast(current_w: float, hour: float, end: float) -> float:
+    """Mean solar power over [hour, end], scaled from the current reading"""
+    now = solar_profile(hour)
+    if end <= hour or now < 0.05:
+        return 0.0
+    steps = np.linspace(hour, end, 32)
+    return current_w * float(np.mean([solar_profile(h) for h in steps])) / now
+
+
+def solve(xtx, xty, yty, sw, sy, n, energy_wh, solar_w, time_left_s):
+    """Fit the consumption model from its normal equations and find the
+    highest constant cruise speed the remaining energy can sustain.
+
+    Runs in the strategy process pool, so takes and returns plain data."""
+    start = time.perf_counter()
+    xtx = np.asarray(xtx)
+    xty = np.asarray(xty)
+
+    diag = {'rows': n, 'energy_wh': energy_wh, 'solar_forecast_w': solar_w,
+            'time_left_s': time_left_s}
+
+    if n < MIN_ROWS:
+        return None, {**diag, 'status': 'insufficient data'}
+
+    # Light ridge keeps the fit stable while the car is cruising steadily
+    ridge = 1e-6 * np.diag(np.diag(xtx)) + 1e-9 * np.eye(len(xty))
+    coef = np.linalg.solve(xtx + ridge, xty)
+
+    sse = max(yty - 2 * coef @ xty + coef @ xtx @ coef, 0.0)
+    sst = yty - sy * sy / sw
+    diag['coefficients'] = dict(zip(FEATURES, coef.tolist()))
+    diag['rmse_w'] = math.sqrt(float(sse) / sw)
+    diag['r2'] = float(1 - sse / sst) if sst > 0 else 0.0
+
+    def drain(v):
+        """Net pack power at a steady speed on the flat"""
+        return coef[0] + coef[1] * v + coef[2] * v ** 3 - solar_w
+
+    if time_left_s <= 0:
+        # Nothing left to plan, keep the last published speed
+        diag['status'] = 'day over'
+        diag['solve_ms'] = (time.perf_counter() - start) * 1000
+        return None, diag
+
+    budget = (energy_wh - RESERVE_WH) * 3600
+    if drain(V_MAX) * time_left_s <= budget:
+        v, status = V_MAX, 'unconstrained'
+    elif drain(V_MIN) * time_left_s > budget:
+        v, status = V_MIN, 'energy short'
+    else:
+        lo, hi = V_MIN, V_MAX
+        while hi - lo > 0.01:
+            mid = (lo + hi) / 2
+            if drain(mid) * time_left_s <= budget:
+                lo = mid
+            else:
+                hi = mid
+        v, status = lo, 'ok'
+
+    diag['status'] = status
+    diag['solve_ms'] = (time.perf_counter() - start) * 1000
+    return v * 3.6, diag
+
+
+class StrategyEngine:
+    """Incremental fit state for the consumption model.
+
+    New historic samples are folded into exponentially weighted normal
+    equations, so each refit costs the same no matter how long we've run.
+    The solve itself only needs these small matrices."""
+
+    def __init__(self):
+        k = len(FEATURES)
+        self.xtx = np.zeros((k, k))
+        self.xty = np.zeros(k)
+        self.yty = 0.0
+        self.sw = 0.0
+        self.sy = 0.0
+        self.n = 0
+        self.offset = 0
+        self._last_key = None
+
+    def ingest(self, historic: dict):
+        """Fold historic samples appended since the last call into the fit"""
+        end = len(historic['Timestamps'])
+        start = max(self.offset - 1, 0)  # need the previous sample for deltas
+        if end - start < 2:
+            return
+        self.offset = end
+
+        t = hhmmss_to_seconds(np.asarray(historic['Timestamps'][start:end], dtype=float))
+        v = np.asarray(historic['Speed2'][start:end], dtype=float) / 3.6
+        h = np.asarray(historic['Altitude'][start:end], dtype=float)
+        p = (np.asarray(historic['Power'][start:end], dtype=float)
+             + np.asarray(historic['Solar'][start:end], dtype=float))
+
+        dt = np.diff(t)
+        ok = (dt > 0) & (dt <= MAX_GAP_S)
+        if not ok.any():
+            return
+        dt = dt[ok]
+        v1 = v[1:][ok]
+        acc = np.diff(v)[ok] / dt
+        climb = np.diff(h)[ok] / dt
+        y = p[1:][ok]
+
+        x = np.column_stack((np.ones_like(v1), v1, v1 ** 3, v1 * acc, climb))
+        w = FORGET ** np.arange(len(y) - 1, -1, -1)
+        decay = FORGET ** len(y)
+
+        self.xtx = decay * self.xtx + (x * w[:, None]).T @ x
+        self.xty = decay * self.xty + (x * w[:, None]).T @ y
+        self.yty = decay * self.yty + float(w @ (y * y))
+        self.sw = decay * self.sw + float(w.sum())
+        self.sy = decay * self.sy + float(w @ y)
+        self.n += len(y)
+
+    def request(self, historic: dict, metric: dict):
+        """Arguments for `solve`, or None if nothing changed since last time"""
+        now = datetime.now()
+        hour = now.hour + now.minute / 60 + now.second / 3600
+        time_left_s = max(DAY_END - hour, 0) * 3600
+
+        solar = historic['Solar'][-SOLAR_WINDOW:]
+        solar_now = sum(solar) / len(solar) if solar else 0.0
+        solar_w = solar_forecast(solar_now, hour, DAY_END)
+        energy_wh = metric['SOC_Ah'] * metric['Pack_Voltage']
+
+        key = (self.n, round(energy_wh), round(solar_w), round(time_left_s / 60))
+        if key == self._last_key:
+            return None
+        self._last_key = key
+
+        return (self.xtx, self.xty, self.yty, self.sw, self.sy, self.n,
+                energy_wh, solar_w, time_left_s)
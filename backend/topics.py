@@ -0,0 +1,81 @@
+import json
+
+
+# Websocket topics. Each metric key belongs to exactly one topic; historic
+# series are topics of their own ("historic:Speed") and "track"/"strategy"
+# map to the top level keys of the same name.
+METRIC_TOPICS = {
+    'overview': ('Pack_Voltage', 'SOC_Ah', 'power_consumption', 'solar_input',
+                 'distance_travelled', 'Speed', 'predicted', 'Pack_Current'),
+    'cmus': ('cmus', 'battery_ranges', 'battery_analytics'),
+    'mppts': ('mppts',),
+    'motor': ('Motor_Temp', 'Motor_Velocity', 'Speed2', 'HeatSink_Temp',
+              'PhaseA_Current', 'PhaseB_Current', 'PhaseC_Current',
+              'Bus_Voltage', 'Bus_Current', 'Bus_Power', 'DSP_Board_Temp'),
+    'flags': ('precharge_state', 'contactor_flags', 'bmsFlags',
+              'MotorLimits', 'MotorErrors'),
+    'cabin': ('CabinSensors',),
+}
+HISTORIC_PREFIX = "historic:"
+EXTRA_TOPICS = ('track', 'strategy')
+
+
+def to_json(obj) -> str:
+    return json.dumps(obj, default=lambda o: "Infinity" if o == float('inf')
+                      else "-Infinity" if o == float('-inf')
+                      else "NaN" if o != o  # NaN check
+                      else None)
+
+
+def all_topics(historic_names) -> set:
+    return (set(METRIC_TOPICS) | set(EXTRA_TOPICS)
+            | {HISTORIC_PREFIX + name for name in historic_names})
+
+
+def expand(names, historic_names) -> set:
+    """Resolve client supplied topic names; "*" is everything and "historic"
+    every series. Unknown names are dropped."""
+    known = all_topics(historic_names)
+    topics = set()
+    for name in names:
+        if name == "*":
+            topics |= known
+        elif name == "historic":
+            topics |= {HISTORIC_PREFIX + n for n in historic_names}
+        elif name in known:
+            topics.add(name)
+    return topics
+
+
+def fragment(topic: str, value) -> str:
+    """JSON body of a topic, ready to splice into a message.
+
+    Metric topics give `"key": value, ...` (an object without braces),
+    the others a single `"name": value` member."""
+    if topic in METRIC_TOPICS:
+        return to_json(value)[1:-1]
+    if topic.startswith(HISTORIC_PREFIX):
+        return to_json(topic[len(HISTORIC_PREFIX):]) + ":" + to_json(value)
+    return to_json(topic) + ":" + to_json(value)
+
+
+def compose(msg_type: str, fragments: dict) -> str:
+    """Assemble a message from per-topic fragments without re-serializing"""
+    metric, historic, extra = [], [], []
+    for topic, frag in fragments.items():
+        if not frag:
+            continue
+        if topic in METRIC_TOPICS:
+            metric.append(frag)
+        elif topic.startswith(HISTORIC_PREFIX):
+            historic.append(frag)
+        else:
+            extra.append(frag)
+
+    parts = ['"type":' + to_json(msg_type)]
+    if metric:
+        parts.append('"metric":{' + ','.join(metric) + '}')
+    if historic:
+        parts.append('"historic":{' + ','.join(historic) + '}')
+    parts += extra
+    return '{' + ','.join(parts) + '}'
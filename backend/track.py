@@ -0,0 +1,233 @@
+import math
+from array import array
+
+import numpy as np
+
+
+EARTH_RADIUS_M = 6371000.0
+TRACK_TOLERANCE_M = 3.0     # max cross-track error of the simplified route
+TRACK_MIN_STEP_M = 1.0      # GPS jitter below this is ignored
+TRACK_MAX_WINDOW = 256      # force a vertex after this many raw points
+POLYLINE_PRECISION = 1e5    # same as google encoded polyline (~1.1m)
+
+
+def polyline_encode(points, prev=(0, 0)) -> str:
+    """Encode [(lat, lon), ...] as a google encoded polyline.
+
+    `prev` is the vertex the chunk continues from, so appended vertices can
+    be encoded on their own and concatenated by the client."""
+    out = []
+    plat = round(prev[0] * POLYLINE_PRECISION)
+    plon = round(prev[1] * POLYLINE_PRECISION)
+    for lat, lon in points:
+        ilat = round(lat * POLYLINE_PRECISION)
+        ilon = round(lon * POLYLINE_PRECISION)
+        for delta in (ilat - plat, ilon - plon):
+            delta = ~(delta << 1) if delta < 0 else (delta << 1)
+            while delta >= 0x20:
+                out.append(chr((0x20 | (delta & 0x1f)) + 63))
+                delta >>= 5
+            out.append(chr(delta + 63))
+        plat, plon = ilat, ilon
+    return "".join(out)
+
+
+def polyline_decode(encoded: str, prev=(0, 0)) -> list:
+    """Inverse of polyline_encode"""
+    points = []
+    coords = [round(prev[0] * POLYLINE_PRECISION), round(prev[1] * POLYLINE_PRECISION)]
+    idx = 0
+    while idx < len(encoded):
+        for c in range(2):
+            shift = result = 0
+            while True:
+                b = ord(encoded[idx]) - 63
+                idx += 1
+                result |= (b & 0x1f) << shift
+                shift += 5
+                if b < 0x20:
+                    break
+            coords[c] += ~(result >> 1) if result & 1 else (result >> 1)
+        points.append((coords[0] / POLYLINE_PRECISION, coords[1] / POLYLINE_PRECISION))
+    return points
+
+
+def _to_xy(lat, lon, ref_lat):
+    """Local equirectangular projection in metres (fine over a few km)"""
+    k = math.radians(1) * EARTH_RADIUS_M
+    return lon * k * math.cos(math.radians(ref_lat)), lat * k
+
+
+def _cross_track(p, a, b):
+    """Distance from p to segment ab, all in projected metres"""
+    dx, dy = b[0] - a[0], b[1] - a[1]
+    seg2 = dx * dx + dy * dy
+    if seg2 == 0:
+        return math.hypot(p[0] - a[0], p[1] - a[1])
+    t = max(0.0, min(1.0, ((p[0] - a[0]) * dx + (p[1] - a[1]) * dy) / seg2))
+    return math.hypot(p[0] - a[0] - t * dx, p[1] - a[1] - t * dy)
+
+
+def simplify(lat: np.ndarray, lon: np.ndarray, tolerance_m: float) -> np.ndarray:
+    """Douglas-Peucker over a full-resolution segment, returns kept indices"""
+    n = len(lat)
+    if n < 3:
+        return np.arange(n)
+
+    k = math.radians(1) * EARTH_RADIUS_M
+    y = lat * k
+    x = lon * k * math.cos(math.radians(float(lat[0])))
+
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        s, e = stack.pop()
+        if e - s < 2:
+            continue
+        dx, dy = x[e] - x[s], y[e] - y[s]
+        px, py = x[s + 1:e] - x[s], y[s + 1:e] - y[s]
+        seg = math.hypot(dx, dy)
+        if seg == 0:
+            d = np.hypot(px, py)
+        else:
+            d = np.abs(px * dy - py * dx) / seg
+        i = int(np.argmax(d))
+        if d[i] > tolerance_m:
+            i += s + 1
+            keep[i] = True
+            stack.append((s, i))
+            stack.append((i, e))
+    return np.flatnonzero(keep)
+
+
+class TrackService:
+    """GPS route store.
+
+    Holds every raw fix for bbox queries and an incrementally simplified
+    polyline (opening-window Douglas-Peucker) whose vertices are final once
+    emitted, so clients only ever need the newly appended ones."""
+
+    def __init__(self, tolerance_m=TRACK_TOLERANCE_M):
+        self.tolerance_m = tolerance_m
+
+        # Full resolution
+        self._lat = array('d')
+        self._lon = array('d')
+        self._ts = array('d')
+
+        # Simplified
+        self.vertices: list[tuple[float, float]] = []
+        self._encoded: list[str] = []
+        self._window: list[tuple[float, float]] = []
+        self._last_chunk = ""
+
+    def __len__(self):
+        return len(self._lat)
+
+    @property
+    def head(self):
+        """Latest raw fix, not necessarily a vertex yet"""
+        if not self._lat:
+            return None
+        return (self._lat[-1], self._lon[-1])
+
+    def append(self, lat: float, lon: float, ts: float = 0.0) -> str:
+        """Add a raw fix. Returns the encoded chunk of vertices committed by
+        this fix (continuing from the previous vertex), or '' if none."""
+        self._last_chunk = ""
+        if not (math.isfinite(lat) and math.isfinite(lon)) or (lat == 0 and lon == 0):
+            return ""
+
+        self._lat.append(lat)
+        self._lon.append(lon)
+        self._ts.append(ts)
+
+        self._last_chunk = self._extend(lat, lon)
+        return self._last_chunk
+
+    def _extend(self, lat, lon) -> str:
+        if not self.vertices:
+            return self._commit((lat, lon))
+
+        anchor = self.vertices[-1]
+        a = _to_xy(*anchor, anchor[0])
+        q = _to_xy(lat, lon, anchor[0])
+        if not self._window and math.hypot(q[0] - a[0], q[1] - a[1]) < TRACK_MIN_STEP_M:
+            return ""
+
+        # Does the straight line anchor -> new fix still cover the window?
+        fits = len(self._window) < TRACK_MAX_WINDOW and all(
+            _cross_track(_to_xy(*p, anchor[0]), a, q) <= self.tolerance_m
+            for p in self._window
+        )
+        if fits:
+            self._window.append((lat, lon))
+            return ""
+
+        # Previous fix becomes a vertex, new fix opens the next window
+        chunk = self._commit(self._window[-1])
+        self._window.append((lat, lon))
+        return chunk
+
+    def _commit(self, vertex) -> str:
+        prev = self.vertices[-1] if self.vertices else (0, 0)
+        chunk = polyline_encode((vertex,), prev)
+        self.vertices.append(vertex)
+        self._encoded.append(chunk)
+        self._window = []
+        return chunk
+
+    def encoded(self) -> str:
+        """Whole simplified route as one encoded polyline"""
+        return "".join(self._encoded)
+
+    def update(self) -> dict:
+        """Incremental payload describing the latest fix"""
+        return {
+            'append': self._last_chunk,
+            'count': len(self.vertices),
+            'head': self.head,
+        }
+
+    def snapshot(self) -> dict:
+        """Initial payload for new clients"""
+        return {
+            'polyline': self.encoded(),
+            'count': len(self.vertices),
+            'head': self.head,
+        }
+
+    def query(self, min_lat, min_lon, max_lat, max_lon, zoom=None) -> dict:
+        """Full-resolution route inside a bbox, as encoded polyline segments
+        (one per contiguous pass through the box). With a web-map zoom level
+        the segments are simplified to about half a pixel."""
+        lat = np.array(self._lat)
+        lon = np.array(self._lon)
+        ts = np.array(self._ts)
+
+        inside = (lat >= min_lat) & (lat <= max_lat) & (lon >= min_lon) & (lon <= max_lon)
+        idx = np.flatnonzero(inside)
+        if len(idx) == 0:
+            return {'segments': [], 'count': 0}
+
+        tolerance = None
+        if zoom is not None:
+            mid_lat = math.radians((min_lat + max_lat) / 2)
+            tolerance = 0.5 * 156543.03392 * math.cos(mid_lat) / (2 ** zoom)
+
+        segments = []
+        count = 0
+        for run in np.split(idx, np.flatnonzero(np.diff(idx) > 1) + 1):
+            seg_lat, seg_lon = lat[run], lon[run]
+            if tolerance is not None:
+                keep = simplify(seg_lat, seg_lon, tolerance)
+                seg_lat, seg_lon, run = seg_lat[keep], seg_lon[keep], run[keep]
+            count += len(run)
+            segments.append({
+                'polyline': polyline_encode(zip(seg_lat.tolist(), seg_lon.tolist())),
+                'start': float(ts[run[0]]),
+                'end': float(ts[run[-1]]),
+            })
+
+        return {'segments': segments, 'count': count}
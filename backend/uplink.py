@@ -0,0 +1,242 @@
+import gzip
+import json
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+import uuid
+
+
+SEGMENT_BYTES = 8 * 1024 * 1024   # spool file size before rolling over
+FSYNC_INTERVAL = 1.0              # seconds between spool fsyncs
+MIN_BATCH = 64 * 1024             # raw bytes per upload
+MAX_BATCH = 8 * 1024 * 1024
+TARGET_BATCH_S = 2.0              # aim for uploads taking about this long
+BACKOFF_MIN = 1.0
+BACKOFF_MAX = 60.0
+HTTP_TIMEOUT = 15
+IDLE_WAIT = 1.0
+
+
+class Spool:
+    """Durable append-only log of JSON lines split into segment files.
+
+    Positions are byte offsets into the whole stream. Segment files are
+    named after the offset they start at, and the last offset the
+    collector acknowledged is kept in `ack`. Segments are deleted once
+    fully acknowledged."""
+
+    def __init__(self, directory: str, segment_bytes: int = SEGMENT_BYTES):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        os.makedirs(directory, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.segments = sorted(int(name[:-4]) for name in os.listdir(directory)
+                               if name.endswith(".seg"))
+        if self.segments:
+            last = self.segments[-1]
+            self.end = last + self._drop_torn_line(self._path(last))
+        else:
+            self.end = 0
+
+        ack_path = os.path.join(directory, "ack")
+        if os.path.exists(ack_path):
+            with open(ack_path) as f:
+                self.acked = int(f.read().strip() or 0)
+        else:
+            self.acked = self.segments[0] if self.segments else 0
+
+        session_path = os.path.join(directory, "session")
+        if not os.path.exists(session_path):
+            with open(session_path, "w") as f:
+                f.write(uuid.uuid4().hex)
+        with open(session_path) as f:
+            self.session = f.read().strip()
+
+        self._file = None
+
+    def _path(self, start: int) -> str:
+        return os.path.join(self.directory, f"{start:020d}.seg")
+
+    @staticmethod
+    def _drop_torn_line(path: str) -> int:
+        """Cut a segment back to its last complete line, in case we lost
+        power mid-write. Returns the new size."""
+        with open(path, "r+b") as f:
+            size = f.seek(0, os.SEEK_END)
+            pos = size
+            while pos > 0:
+                step = min(pos, 64 * 1024)
+                f.seek(pos - step)
+                cut = f.read(step).rfind(b"\n")
+                if cut >= 0:
+                    pos = pos - step + cut + 1
+                    break
+                pos -= step
+            if pos != size:
+                print(f"uplink: dropped {size - pos} byte(s) of a torn line in {path}")
+                f.truncate(pos)
+                f.flush()
+                os.fsync(f.fileno())
+            return pos
+
+    def append(self, line: bytes):
+        with self.lock:
+            if self._file is None or self.end - self.segments[-1] >= self.segment_bytes:
+                if self._file is not None:
+                    self._file.close()
+                if not self.segments or self.end > self.segments[-1]:
+                    self.segments.append(self.end)
+                self._file = open(self._path(self.segments[-1]), "ab")
+            self._file.write(line)
+            self.end += len(line)
+
+    def sync(self):
+        with self.lock:
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+
+    def read(self, start: int, max_bytes: int) -> bytes:
+        """Whole lines from `start`, at most max_bytes unless a single line
+        is longer"""
+        with self.lock:
+            if self._file is not None:
+                self._file.flush()
+            bounds = list(zip(self.segments, self.segments[1:] + [self.end]))
+
+        out = bytearray()
+        pos = start
+        for seg_start, seg_end in bounds:
+            if seg_end <= pos:
+                continue
+            with open(self._path(seg_start), "rb") as f:
+                f.seek(pos - seg_start)
+                chunk = f.read(min(max_bytes - len(out), seg_end - pos))
+            out += chunk
+            pos += len(chunk)
+            if len(out) >= max_bytes:
+                break
+
+        cut = out.rfind(b"\n") + 1
+        if cut == 0 and len(out) >= max_bytes:
+            return self.read(start, max_bytes * 2)
+        return bytes(out[:cut])
+
+    def ack(self, offset: int):
+        with self.lock:
+            self.acked = offset
+            tmp = os.path.join(self.directory, "ack.tmp")
+            with open(tmp, "w") as f:
+                f.write(str(offset))
+            os.replace(tmp, os.path.join(self.directory, "ack"))
+
+            # Drop fully acknowledged segments, never the one being written
+            while len(self.segments) > 1 and self.segments[1] <= offset:
+                os.remove(self._path(self.segments.pop(0)))
+
+    def close(self):
+        self.sync()
+        with self.lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class Uplink:
+    """Store-and-forward replication of decoded frames to a remote collector.
+
+    `submit` only enqueues, so ingest never waits on disk or network. A
+    writer thread appends frames to the spool, and a shipper thread posts
+    gzipped batches from the last acknowledged offset. Failed posts back
+    off exponentially. Batch size follows the measured throughput, so an
+    upload takes about TARGET_BATCH_S."""
+
+    def __init__(self, url: str, spool_dir: str):
+        self.url = url
+        self.spool = Spool(spool_dir)
+        self.batch_bytes = MIN_BATCH
+        self._queue = queue.SimpleQueue()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._threads = [
+            threading.Thread(target=self._write, daemon=True),
+            threading.Thread(target=self._ship, daemon=True),
+        ]
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout=HTTP_TIMEOUT)
+        self.spool.close()
+
+    def submit(self, ptype: str, data: dict):
+        self._queue.put((time.time(), ptype, data))
+
+    def _write(self):
+        last_sync = time.monotonic()
+        while True:
+            try:
+                item = self._queue.get(timeout=FSYNC_INTERVAL)
+            except queue.Empty:
+                item = False
+            if item is None:
+                break
+            if item:
+                received, ptype, data = item
+                line = json.dumps({"received": received, "type": ptype, "data": data})
+                self.spool.append(line.encode() + b"\n")
+                self._wake.set()
+
+            if time.monotonic() - last_sync >= FSYNC_INTERVAL:
+                self.spool.sync()
+                last_sync = time.monotonic()
+
+    def _post(self, body: bytes, start: int, end: int) -> int:
+        request = urllib.request.Request(self.url, data=body, method="POST", headers={
+            "Content-Type": "application/x-ndjson",
+            "Content-Encoding": "gzip",
+            "X-Session": self.spool.session,
+            "X-Spool-Start": str(start),
+            "X-Spool-End": str(end),
+        })
+        with urllib.request.urlopen(request, timeout=HTTP_TIMEOUT) as response:
+            return int(json.load(response)["ack"])
+
+    def _ship(self):
+        backoff = 0.0
+        while not self._stop.is_set():
+            start = self.spool.acked
+            data = self.spool.read(start, int(self.batch_bytes))
+            if not data:
+                self._wake.wait(IDLE_WAIT)
+                self._wake.clear()
+                continue
+
+            body = gzip.compress(data, compresslevel=6)
+            sent = time.monotonic()
+            try:
+                ack = self._post(body, start, start + len(data))
+            except (OSError, ValueError, KeyError) as e:
+                backoff = min(max(backoff * 2, BACKOFF_MIN), BACKOFF_MAX)
+                self.batch_bytes = max(MIN_BATCH, self.batch_bytes / 2)
+                print(f"uplink: {e}, retrying in {backoff:.0f}s")
+                self._stop.wait(backoff * random.uniform(0.5, 1.0))
+                continue
+            backoff = 0.0
+
+            # Grow/shrink the batch towards what the link moves in TARGET_BATCH_S
+            elapsed = max(time.monotonic() - sent, 1e-3)
+            target = len(data) / elapsed * TARGET_BATCH_S
+            self.batch_bytes = min(max(0.7 * self.batch_bytes + 0.3 * target, MIN_BATCH), MAX_BATCH)
+
+            self.spool.ack(min(max(ack, start), self.spool.end))
@@ -29,6 +29,15 @@ const initialState: TelemetryData = {
             min_volt: 0,
             max_volt: 0,
         },
+        battery_analytics: {
+            volt: { min: 0, max: 0, mean: 0, spread: 0 },
+            temp: { min: 0, max: 0, mean: 0, spread: 0 },
+            z: Array.from({ length: 5 }, () => Array.from({ length: 8 }, () => 0)),
+            dvdt: Array.from({ length: 5 }, () => Array.from({ length: 8 }, () => 0)),
+            weakest: [0, 0],
+            outliers: [],
+            warning: false,
+        },
         precharge_state: 0,
         contactor_flags: {
             contactor1_error: false,
@@ -11,6 +11,23 @@ export interface BatteryRangeData {
     max_volt: number;
 }
 
+export interface PackStats {
+    min: number;
+    max: number;
+    mean: number;
+    spread: number;
+}
+
+export interface BatteryAnalyticsData {
+    volt: PackStats;
+    temp: PackStats;
+    z: number[][];           // per-cell deviation from the pack mean, in std devs
+    dvdt: number[][];        // per-cell trend, mV/s
+    weakest: [number, number];   // [cmu, cell]
+    outliers: [number, number][];
+    warning: boolean;
+}
+
 export interface CabinSensors {
     Cabin_CO_Content: number;
     Cabin_CH4_Content: number;
@@ -68,6 +85,7 @@ export interface TelemetryData {
         Pack_Current: number;
         cmus: BatteryPackData[];
         battery_ranges: BatteryRangeData;
+        battery_analytics: BatteryAnalyticsData;
         precharge_state: number;
         contactor_flags: {
             [key: string]: boolean;